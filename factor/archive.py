@@ -285,7 +285,7 @@ def archive(parset_file, directions, dir_output, full=False, archive_subdata=Fal
         band_list = []
         for bf in band_state_files:
             try:
-                with open(bf, 'r') as f:
+                with open(bf, 'rb') as f:
                     b = pickle.load(f)
                     file_list.append(b['skymodel_dirindep'])
                     band_list.append(b['name'])
@@ -889,7 +889,7 @@ def get_current_step(direction):
         direction.name, 'statefile')
     if os.path.exists(statefile):
         try:
-            f = open(statefile, 'r')
+            f = open(statefile, 'rb')
             d = pickle.load(f)
             f.close()
         except (EOFError, ValueError):
@@ -1028,7 +1028,7 @@ def read_vertices(filename):
     """
     Returns facet vertices
     """
-    with open(filename, 'r') as f:
+    with open(filename, 'rb') as f:
         direction_dict = pickle.load(f)
     return direction_dict['vertices']
 
@@ -4,10 +4,10 @@ Module that holds all direction-related functions
 import os
 import numpy as np
 import logging
-from factor.lib.direction import Direction
+from factor.lib.direction import Direction, angle_to_deg
 from factor.lib.polygon import Polygon
 import sys
-from scipy.spatial import Delaunay
+from scipy.spatial import Delaunay, cKDTree
 
 #multiprocessing required to faster uniformity search
 from multiprocessing import Pool
@@ -38,7 +38,6 @@ def directions_read(directions_file, factor_working_dir):
         List of Direction objects
 
     """
-    from astropy.coordinates import Angle
 
     if not os.path.isfile(directions_file):
         log.critical("Directions file (%s) not found." % (directions_file))
@@ -66,8 +65,8 @@ def directions_read(directions_file, factor_working_dir):
     data = []
     for direction in directions:
         RAstr, Decstr = direction['radec'].split(',')
-        ra = Angle(RAstr).to('deg').value
-        dec = Angle(Decstr).to('deg').value
+        ra = angle_to_deg(RAstr, is_ra=True)
+        dec = angle_to_deg(Decstr)
 
         # Check coordinates
         if np.isnan(ra) or ra < 0 or ra > 360:
@@ -712,7 +711,6 @@ def thiessen(directions_list, field_ra_deg, field_dec_deg, faceting_radius_deg,
     import shapely.geometry
     from shapely.ops import cascaded_union
     from itertools import combinations
-    from astropy.coordinates import Angle
 
     # Select directions inside FOV (here defined as ellipse given by
     # faceting_radius_deg and the mean elevation)
@@ -794,8 +792,8 @@ def thiessen(directions_list, field_ra_deg, field_dec_deg, faceting_radius_deg,
         if target_ra is not None and target_dec is not None and target_radius_arcmin is not None:
             log.info('Including target ({0}, {1}) in facet adjustment'.format(
                 target_ra, target_dec))
-            tra = Angle(target_ra).to('deg').value
-            tdec = Angle(target_dec).to('deg').value
+            tra = angle_to_deg(target_ra, is_ra=True)
+            tdec = angle_to_deg(target_dec)
             tx, ty = radec2xy([tra], [tdec], refRA=field_ra_deg, refDec=field_dec_deg)
             sx.extend(tx)
             sy.extend(ty)
@@ -931,9 +929,11 @@ def add_facet_info(d, selfcal_poly, facet_poly, midRA, midDec):
     ra2, dec2 = xy2radec([xmax], [ymax], midRA, midDec)
     ra3, dec3 = xy2radec([xmax], [ymin], midRA, midDec)
     ra_center, dec_center = xy2radec([xmid], [ymid], midRA, midDec)
-    ra_width_deg = calculateSeparation(ra1, dec1, ra3, dec3)
-    dec_width_deg = calculateSeparation(ra3, dec3, ra2, dec2)
-    width_deg = max(ra_width_deg.value, dec_width_deg.value)
+    # Find the RA and Dec widths with a single separation call and store the
+    # larger one as a float (rather than as a one-element array)
+    widths_deg = calculateSeparation([ra1[0], ra3[0]], [dec1[0], dec3[0]],
+        [ra3[0], ra2[0]], [dec3[0], dec2[0]]).value
+    width_deg = float(max(widths_deg))
 
     d.vertices = thiessen_poly_deg
     d.vertices_cal = thiessen_poly_deg_cal
@@ -1357,7 +1357,7 @@ def read_vertices(filename):
     """
     import pickle
 
-    with open(filename, 'r') as f:
+    with open(filename, 'rb') as f:
         direction_dict = pickle.load(f)
     return direction_dict['vertices']
 
@@ -1426,7 +1426,7 @@ def find_nearest(direction1, directions):
     Parameters
     ----------
     direction1 : Direction object
-        Target direction for which nearset direction is to be found
+        Target direction for which nearest direction is to be found
     directions : list
         List of directions to search. Should not include the target direction
 
@@ -1438,12 +1438,49 @@ def find_nearest(direction1, directions):
         Separation in degrees
 
     """
-    sep = []
-    for direction2 in directions:
-        sep.append(calculateSeparation(direction1.ra, direction1.dec,
-                            direction2.ra, direction2.dec).value)
+    return find_nearest_all([direction1], directions)[0]
 
-    return directions[np.argmin(sep)], sep[np.argmin(sep)]
+
+def find_nearest_all(directions1, directions):
+    """
+    Finds nearest direction to each of the input directions
+
+    The search is done with a single KD-tree query on unit vectors, so the
+    separations do not have to be calculated for every pair of directions
+
+    Parameters
+    ----------
+    directions1 : list
+        Target directions for which the nearest directions are to be found
+    directions : list
+        List of directions to search. Should not include the target directions
+
+    Returns
+    -------
+    nearest : list of (Direction object, float) tuples
+        Nearest direction and separation in degrees for each target direction
+
+    """
+    if len(directions1) == 0:
+        return []
+    tree = cKDTree(_radec_to_xyz([d.ra for d in directions], [d.dec for d in directions]))
+    chords, indices = tree.query(_radec_to_xyz([d.ra for d in directions1],
+        [d.dec for d in directions1]), k=1)
+
+    # Convert the chord lengths to angular separations
+    seps = np.degrees(2.0 * np.arcsin(np.clip(chords / 2.0, 0.0, 1.0)))
+
+    return [(directions[i], sep) for i, sep in zip(indices, seps)]
+
+
+def _radec_to_xyz(ra, dec):
+    """
+    Returns unit vectors for the given RA and Dec values (in degrees)
+    """
+    ra_rad = np.radians(np.asarray(ra, dtype=float))
+    dec_rad = np.radians(np.asarray(dec, dtype=float))
+    return np.column_stack([np.cos(dec_rad) * np.cos(ra_rad),
+        np.cos(dec_rad) * np.sin(ra_rad), np.sin(dec_rad)])
 
 
 def _float_approx_equal(x, y, tol=1e-18, rel=1e-7):
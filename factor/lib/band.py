@@ -9,7 +9,14 @@ import casacore.tables as pt
 import lofar.parmdb
 import numpy as np
 import multiprocessing
-import itertools
+import functools
+import collections
+from factor.lib.divisors import get_divisors, get_nearest_divisor
+
+# Parameters shared by all chunks of an MS (see process_chunk())
+ChunkConfig = collections.namedtuple('ChunkConfig', ['ms_file', 'nchunks',
+    'mystarttime', 'myendtime', 'chunksize', 'colnames_to_keep', 'newdirname',
+    'local_dir', 'min_fraction', 'use_compression'])
 
 
 class Band(object):
@@ -40,15 +47,25 @@ class Band(object):
         to be kept
 
     """
+    # Attributes are declared as slots, as there is one instance per band. The
+    # state is therefore saved and loaded using these names (see save_state())
+    __slots__ = ('files', 'msnames', 'working_dir', 'numMS', '_ms_meta', 'freq',
+        'nchan', 'chan_freqs_hz', 'chan_width_hz', 'name', 'log', 'chunks_dir',
+        'save_file', 'skymodel_dirindep', 'ra', 'dec', 'diam', 'mean_el_rad',
+        'fwhm_deg', 'has_sub_data', 'has_sub_data_new', 'sumsamples',
+        'minSamplesPerFile', 'starttime', 'endtime', 'timepersample',
+        'missing_channels')
+
     def __init__(self, MSfiles, factor_working_dir, skymodel_dirindep=None,
         local_dir=None, test_run=False, check_files=True,
         process_files=False, chunk_size_sec=2400.0, use_compression=False,
         min_fraction=0.5):
 
         self.files = MSfiles
-        self.msnames = [ MS.split('/')[-1] for MS in self.files ]
+        self.msnames = [ os.path.basename(MS.rstrip('/')) for MS in self.files ]
         self.working_dir = factor_working_dir
         self.numMS = len(self.files)
+        self._ms_meta = {}
 
         # Get the frequency info and set name
         sw = pt.table(self.files[0]+'::SPECTRAL_WINDOW', ack=False)
@@ -86,25 +103,23 @@ class Band(object):
             ant.close()
 
             # Find mean elevation and FOV
+            sum_el = 0.0
+            num_el = 0
             for MS_id in xrange(self.numMS):
                 # Add (virtual) elevation column to MS
-                tab = pt.table(self.files[MS_id], ack=False)
-                exiting_colnames = tab.colnames()
-                if 'AZEL1' not in exiting_colnames:
-                    tab.close()
+                if 'AZEL1' not in self._scan_ms(self.files[MS_id])['colnames']:
                     pt.addDerivedMSCal(self.files[MS_id])
-                    tab = pt.table(self.files[MS_id], ack=False)
+                tab = pt.table(self.files[MS_id], ack=False)
 
-                # Calculate mean elevation
-                if MS_id == 0:
-                    global_el_values = tab.getcol('AZEL1', rowincr=10000)[:, 1]
-                else:
-                    global_el_values = np.hstack( (global_el_values, tab.getcol('AZEL1', rowincr=10000)[:, 1]) )
+                # Calculate mean elevation of every 10000th row
+                el_values = tab.getcol('AZEL1', rowincr=10000)[:, 1]
+                sum_el += np.sum(el_values)
+                num_el += len(el_values)
                 tab.close()
 
                 # Remove (virtual) elevation column from MS
                 pt.removeDerivedMSCal(self.files[MS_id])
-            self.mean_el_rad = np.mean(global_el_values)
+            self.mean_el_rad = sum_el / num_el
             sec_el = 1.0 / np.sin(self.mean_el_rad)
             self.fwhm_deg = 1.1 * ((3.0e8 / self.freq) / self.diam) * 180. / np.pi * sec_el
 
@@ -112,12 +127,10 @@ class Band(object):
             self.has_sub_data = True
             self.has_sub_data_new = False
             for MSid in xrange(self.numMS):
-                tab = pt.table(self.files[MSid], ack=False)
-                if not 'SUBTRACTED_DATA_ALL' in tab.colnames():
+                if not 'SUBTRACTED_DATA_ALL' in self._scan_ms(self.files[MSid])['colnames']:
                     self.log.error('SUBTRACTED_DATA_ALL column not found in file '
                         '{}'.format(self.files[MSid]))
                     self.has_sub_data = False
-                tab.close()
             if not self.has_sub_data:
                 self.log.info('Exiting...')
                 sys.exit(1)
@@ -136,17 +149,13 @@ class Band(object):
                 self.starttime = np.finfo('d').max
                 self.endtime = 0.
                 for MSid in xrange(self.numMS):
-                    tab = pt.table(self.files[MSid], ack=False)
-                    self.starttime = min(self.starttime,np.min(tab.getcol('TIME')))
-                    self.endtime = max(self.endtime,np.min(tab.getcol('TIME')))
-                    for t2 in tab.iter(["ANTENNA1","ANTENNA2"]):
-                        if (t2.getcell('ANTENNA1',0)) < (t2.getcell('ANTENNA2',0)):
-                            self.timepersample = t2.col('TIME')[1] - t2.col('TIME')[0]
-                            numsamples = t2.nrows()
-                            self.sumsamples += numsamples
-                            self.minSamplesPerFile = min(self.minSamplesPerFile,numsamples)
-                            break
-                    tab.close()
+                    meta = self._scan_ms(self.files[MSid])
+                    self.starttime = min(self.starttime, meta['starttime'])
+                    self.endtime = max(self.endtime, meta['endtime'])
+                    self.timepersample = meta['timepersample']
+                    numsamples = meta['ntimes']
+                    self.sumsamples += numsamples
+                    self.minSamplesPerFile = min(self.minSamplesPerFile,numsamples)
         self.save_state()
 
         self.log.debug("Using {0} files.".format(len(self.files)))
@@ -163,20 +172,18 @@ class Band(object):
         """
         # check that all MSs have the same frequency axis
         for MS_id in xrange(1,self.numMS):
-            sw = pt.table(self.files[MS_id]+'::SPECTRAL_WINDOW', ack=False)
-            if self.freq != sw.col('REF_FREQUENCY')[0] or self.nchan != sw.col('NUM_CHAN')[0] \
-                    or not np.array_equal(self.chan_freqs_hz, sw.getcell('CHAN_FREQ',0)) \
-                    or not np.array_equal(self.chan_width_hz, sw.getcell('CHAN_WIDTH',0)[0] ):
+            meta = self._scan_ms(self.files[MS_id])
+            if self.freq != meta['ref_freq'] or self.nchan != meta['nchan'] \
+                    or not np.array_equal(self.chan_freqs_hz, meta['chan_freqs_hz']) \
+                    or not np.array_equal(self.chan_width_hz, meta['chan_width_hz']):
                 self.log.critical('Frequency axis for MS {0} differs from the one for MS {1}! '
                                   'Exiting!'.format(self.files[MS_id],self.files[0]))
                 sys.exit(1)
-            sw.close()
 
         # check for gaps in the frequency channels
-        self.missing_channels = []
-        for i, (freq1, freq2) in enumerate(zip(self.chan_freqs_hz[:-1], self.chan_freqs_hz[1:])):
-            ngap = int(round((freq2 - freq1)/self.chan_width_hz))
-            self.missing_channels.extend([i + j + 1 for j in range(ngap-1)])
+        ngaps = np.rint(np.diff(self.chan_freqs_hz) / self.chan_width_hz).astype(np.int64)
+        gap_indices = np.nonzero(ngaps > 1)[0]
+        self.missing_channels = [i + j + 1 for i in gap_indices for j in range(ngaps[i]-1)]
         self.log.debug('Missing channels: {}'.format(self.missing_channels))
 
 
@@ -208,30 +215,24 @@ class Band(object):
         newfiles = []
         for MS_id in xrange(self.numMS):
             nchunks = 1
-            tab = pt.table(self.files[MS_id], ack=False)
+            meta = self._scan_ms(self.files[MS_id])
 
             # Make filter for data columns that we don't need. These include imaging
             # columns and those made during initial subtraction
-            colnames = tab.colnames()
             colnames_to_remove = ['MODEL_DATA', 'CORRECTED_DATA', 'IMAGING_WEIGHT',
                 'SUBTRACTED_DATA_HIGH', 'SUBTRACTED_DATA_ALL_NEW', 'SUBTRACTED_DATA',
                 'LOFAR_FULL_RES_FLAG']
-            colnames_to_keep = [c for c in colnames if c not in colnames_to_remove]
-
-            timepersample = tab.getcell('EXPOSURE',0)
-            timetab = tab.sort('unique desc TIME')
-            tab.close()
-            timearray = timetab.getcol('TIME')
-            timetab.close()
-            numsamples = len(timearray)
-            mystarttime = np.min(timearray)
-            myendtime = np.max(timearray)
+            colnames_to_keep = [c for c in meta['colnames'] if c not in colnames_to_remove]
+
+            timepersample = meta['exposure']
+            numsamples = meta['ntimes']
+            mystarttime = meta['starttime']
+            myendtime = meta['endtime']
             assert (timepersample*(numsamples-1)+.5) > (myendtime-mystarttime)
             if (myendtime-mystarttime) > (2.*chunksize):
                 nchunks = int((numsamples*timepersample)/chunksize)
             if test_run:
                 self.log.debug('Would split (or not) {0} into {1} chunks. '.format(self.files[MS_id], nchunks))
-                tab.close()
                 continue
 
             # Define directory where chunks are stored
@@ -242,17 +243,15 @@ class Band(object):
             if nchunks > 1 or use_compression:
                 self.log.debug('Spliting {0} into {1} chunks...'.format(self.files[MS_id], nchunks))
 
-                pool = multiprocessing.Pool()
-                results = pool.map(process_chunk_star,
-                    itertools.izip(itertools.repeat(self.files[MS_id]),
-                    range(nchunks), itertools.repeat(nchunks),
-                    itertools.repeat(mystarttime),
-                    itertools.repeat(myendtime), itertools.repeat(chunksize),
-                    itertools.repeat(colnames_to_keep),
-                    itertools.repeat(newdirname),
-                    itertools.repeat(local_dir),
-                    itertools.repeat(min_fraction),
-                    itertools.repeat(use_compression) ))
+                # Batch the tasks sent to each worker to reduce the IPC overhead,
+                # and don't start more workers than there are chunks
+                ncpu = multiprocessing.cpu_count()
+                pool = multiprocessing.Pool(processes=min(nchunks, ncpu))
+                config = ChunkConfig(self.files[MS_id], nchunks, mystarttime,
+                    myendtime, chunksize, colnames_to_keep, newdirname, local_dir,
+                    min_fraction, use_compression)
+                results = pool.map(functools.partial(process_chunk_star, config),
+                    range(nchunks), chunksize=max(1, nchunks // (ncpu*2 + 1)))
                 pool.close()
                 pool.join()
 
@@ -290,10 +289,33 @@ class Band(object):
         if test_run:
             return
         self.files = newfiles
-        self.msnames = [ os.path.basename(MS) for MS in self.files ]
+        self.msnames = [ os.path.basename(MS.rstrip('/')) for MS in self.files ]
         self.numMS = len(self.files)
 
 
+    def _scan_ms(self, ms_file):
+        """
+        Returns the metadata needed from an MS
+
+        The results are cached, so subsequent calls for the same MS do not
+        touch the disk
+
+        Parameters
+        ----------
+        ms_file : str
+            Filename of MS
+
+        Returns
+        -------
+        meta : dict
+            Dict of metadata (see read_ms_metadata())
+
+        """
+        if ms_file not in self._ms_meta:
+            self._ms_meta[ms_file] = read_ms_metadata(ms_file)
+        return self._ms_meta[ms_file]
+
+
     def get_nearest_frequstep(self, freqstep):
         """
         Gets the nearest frequstep
@@ -309,15 +331,9 @@ class Band(object):
             Optimum frequency step nearest to target step
 
         """
-        # first generate a list of possible values for freqstep
-        if not hasattr(self, 'freq_divisors'):
-            tmp_divisors = []
-            for step in range(self.nchan,0,-1):
-                if (self.nchan % step) == 0:
-                    tmp_divisors.append(step)
-            self.freq_divisors = np.array(tmp_divisors)
-        idx = np.argmin(np.abs(self.freq_divisors-freqstep))
-        return self.freq_divisors[idx]
+        # The possible values for freqstep are the divisors of the number of
+        # channels. In case of a tie, the larger one is used
+        return get_nearest_divisor(get_divisors(self.nchan), freqstep)
 
 
     def save_state(self):
@@ -325,13 +341,16 @@ class Band(object):
         Saves the band state to a file
 
         """
-        import pickle
+        import cPickle as pickle
 
         with open(self.save_file, 'wb') as f:
-            # Remove log object, as it cannot be pickled
-            save_dict = self.__dict__.copy()
-            save_dict.pop('log')
-            pickle.dump(save_dict, f)
+            # Skip the log object, as it cannot be pickled, and caches and arrays
+            # that are cheap to regenerate (the frequency axis is always reread
+            # from the MS in __init__)
+            skip = ['log', '_ms_meta', 'chan_freqs_hz']
+            save_dict = dict((k, getattr(self, k)) for k in self.__slots__
+                             if k not in skip and hasattr(self, k))
+            pickle.dump(save_dict, f, pickle.HIGHEST_PROTOCOL)
 
 
     def load_state(self):
@@ -343,18 +362,73 @@ class Band(object):
         success : bool
             True if state was successfully loaded, False if not
         """
-        import pickle
+        import cPickle as pickle
 
         try:
-            with open(self.save_file, 'r') as f:
+            with open(self.save_file, 'rb') as f:
                 d = pickle.load(f)
-            self.__dict__.update(d)
+
+            # Attributes that no longer exist (e.g., the frequency divisors
+            # stored by older versions) are ignored
+            for k, v in d.items():
+                if k in self.__slots__:
+                    setattr(self, k, v)
             return True
-        except:
+        except (IOError, OSError, EOFError, ValueError, KeyError,
+                pickle.UnpicklingError):
             return False
 
 
 
+def read_ms_metadata(ms_file):
+    """
+    Reads the metadata needed from an MS, opening each table only once
+
+    Parameters
+    ----------
+    ms_file : str
+        Filename of MS
+
+    Returns
+    -------
+    meta : dict
+        Dict with column names, exposure, time range, number of time slots
+        and sample time of the main table, and the frequency axis from the
+        SPECTRAL_WINDOW table
+
+    """
+    tab = pt.table(ms_file, ack=False)
+
+    # Get the time range, number of time slots and sample time from the unique
+    # times of the whole table. Only the cells needed are read
+    timetab = tab.sort('unique TIME', columns='TIME')
+    ntimes = timetab.nrows()
+    meta = {'colnames': tuple(tab.colnames()),
+            'exposure': tab.getcell('EXPOSURE', 0),
+            'starttime': timetab.getcell('TIME', 0),
+            'endtime': timetab.getcell('TIME', ntimes-1),
+            'ntimes': ntimes}
+    if ntimes > 1:
+        meta['timepersample'] = timetab.getcell('TIME', 1) - meta['starttime']
+    else:
+        meta['timepersample'] = meta['exposure']
+    timetab.close()
+    tab.close()
+
+    sw = pt.table(ms_file+'::SPECTRAL_WINDOW', ack=False)
+    meta['ref_freq'] = sw.col('REF_FREQUENCY')[0]
+    meta['nchan'] = sw.col('NUM_CHAN')[0]
+    meta['chan_freqs_hz'] = sw.getcell('CHAN_FREQ', 0)
+    meta['chan_width_hz'] = sw.getcell('CHAN_WIDTH', 0)[0]
+    sw.close()
+
+    # The cached values are shared by everything that reads them, so make sure
+    # they cannot be modified in place
+    meta['chan_freqs_hz'].setflags(write=False)
+
+    return meta
+
+
 def find_unflagged_fraction(ms_file):
     """
     Finds the fraction of data that is unflagged
@@ -372,10 +446,15 @@ def find_unflagged_fraction(ms_file):
     """
     import subprocess
 
+    # The total number of elements is simply nrows * nchannels * npols, so only
+    # the number of unflagged elements needs a scan of the FLAG column
+    t = pt.table(ms_file, ack=False)
+    nelements = t.nrows() * np.prod(t.getcell('FLAG', 0).shape)
+    t.close()
+
     # Call taql. Note that we do not use pt.taql(), as pt.taql() can cause
     # hanging/locking issues on some systems
-    p = subprocess.Popen("taql 'CALC sum([select nfalse(FLAG) from {0}]) / "
-        "sum([select nelements(FLAG) from {0}])'".format(ms_file),
+    p = subprocess.Popen("taql 'CALC sum([select nfalse(FLAG) from {0}])'".format(ms_file),
         shell=True, stdout=subprocess.PIPE)
     r = p.communicate()
 
@@ -386,23 +465,33 @@ def find_unflagged_fraction(ms_file):
         try:
             t = pt.table(ms_file, ack=False)
             flags_per_element = t.calc('nfalse(FLAG)')
-            nelements = t.calc('nelements(FLAG)')[0] # = number of channels * number of pols
-            unflagged_fraction = float(np.sum(flags_per_element)) / nelements / len(t)
+            unflagged_fraction = float(np.sum(flags_per_element)) / nelements
             t.close()
         except:
             print('taql exited abnormally checking flagged fraction for file {}.'.format(ms_file))
             sys.exit(1)
     else:
-        unflagged_fraction = float(r[0])
+        unflagged_fraction = float(r[0]) / nelements
 
     return unflagged_fraction
 
 
-def process_chunk_star(inputs):
+def process_chunk_star(config, chunkid):
     """
     Simple helper function for pool.map
+
+    Parameters
+    ----------
+    config : ChunkConfig
+        Parameters shared by all chunks of an MS
+    chunkid : int
+        ID of chunk
+
     """
-    return process_chunk(*inputs)
+    return process_chunk(config.ms_file, chunkid, config.nchunks,
+        config.mystarttime, config.myendtime, config.chunksize,
+        config.colnames_to_keep, config.newdirname, config.local_dir,
+        config.min_fraction, config.use_compression)
 
 
 def process_chunk(ms_file, chunkid, nchunks, mystarttime, myendtime, chunksize,
@@ -454,7 +543,9 @@ def process_chunk(ms_file, chunkid, nchunks, mystarttime, myendtime, chunksize,
         starttime -= chunksize
     if chunkid == (nchunks-1):
         endtime += 2.*chunksize
-    tab = pt.table(ms_file, lockoptions='autonoread', ack=False)
+    # The source MS is only read, by all chunk workers at once, so open it
+    # without locking to avoid serializing the workers on the table lock
+    tab = pt.table(ms_file, lockoptions='nolock', ack=False)
     seltab = tab.query('TIME >= ' + str(starttime) + ' && TIME < ' + str(endtime),
         sortlist='TIME,ANTENNA1,ANTENNA2', columns=','.join(colnames_to_keep))
 
@@ -561,11 +652,11 @@ def process_chunk(ms_file, chunkid, nchunks, mystarttime, myendtime, chunksize,
             seltab.copy(chunk_file, deep=True)
 
         if local_dir is not None:
-            # Copy temp file to original output location and clean up
-            chunk_file_destination_dir = os.path.dirname(chunk_file_original)
-            os.system('/bin/cp -r {0} {1}'.format(chunk_file, chunk_file_destination_dir))
-            if not os.path.samefile(chunk_file, chunk_file_original):
-                shutil.rmtree(chunk_file)
+            # Move temp file to original output location (a rename if both are
+            # on the same filesystem)
+            if not (os.path.exists(chunk_file_original) and
+                    os.path.samefile(chunk_file, chunk_file_original)):
+                shutil.move(chunk_file, chunk_file_original)
             chunk_file = chunk_file_original
 
     else:
@@ -2,6 +2,8 @@
 Definition of the direction class
 """
 import os
+import re
+import math
 import logging
 from astropy.coordinates import Angle
 import numpy as np
@@ -12,6 +14,121 @@ from scipy.ndimage import gaussian_filter
 from scipy.special import erf
 import sys
 import glob
+import shutil
+import multiprocessing.pool
+import cPickle as pickle
+from factor.lib.operation import load_datamap
+from factor.lib.divisors import get_divisors, get_nearest_divisor
+
+
+def _make_optimum_sizes(max_size):
+    """
+    Returns a sorted array of the even numbers up to max_size that have no prime
+    factors larger than 7
+    """
+    sizes = []
+    p2 = 2
+    while p2 <= max_size:
+        p3 = p2
+        while p3 <= max_size:
+            p5 = p3
+            while p5 <= max_size:
+                p7 = p5
+                while p7 <= max_size:
+                    sizes.append(p7)
+                    p7 *= 7
+                p5 *= 5
+            p3 *= 3
+        p2 *= 2
+    return np.array(sorted(sizes))
+
+
+def _is_7_smooth(n):
+    """
+    Returns True if n has no prime factors larger than 7
+    """
+    for p in (2, 3, 5, 7):
+        while n % p == 0:
+            n //= p
+    return n == 1
+
+
+# Sexagesimal angles, such as "14h41m01.88s", "+35d08m30.5s" or "14:41:01.88"
+_SEXAGESIMAL_RE = re.compile(r'^\s*([+-]?)(\d+)([hd:])\s*(\d+)[m:]\s*(\d+(?:\.\d*)?)s?\s*$')
+
+
+def angle_to_deg(angle, is_ra=False):
+    """
+    Converts an angle string to degrees
+
+    Sexagesimal strings are parsed directly, as astropy's Angle is slow.
+    Other formats are passed to Angle
+
+    Parameters
+    ----------
+    angle : str
+        Angle string, e.g. "14h41m01.88s" or "+35d08m30.5s"
+    is_ra : bool, optional
+        If True, colon-separated strings are taken to be in hours (as for RA);
+        otherwise they are taken to be in degrees
+
+    Returns
+    -------
+    angle_deg : float
+        Angle in degrees
+
+    """
+    match = _SEXAGESIMAL_RE.match(angle)
+    if match is None:
+        return Angle(angle).to('deg').value
+    sign, d, sep, m, sec = match.groups()
+    angle_deg = float(d) + float(m) / 60.0 + float(sec) / 3600.0
+    if sep == 'h' or (sep == ':' and is_ra):
+        angle_deg *= 15.0
+    if sign == '-':
+        angle_deg = -angle_deg
+    return angle_deg
+
+
+# Values of the region and sky model arguments that mean "not given"
+_EMPTY_VALUES = frozenset(['', 'empty', 'Empty', 'EMPTY'])
+
+
+def _is_empty(value):
+    """
+    Returns True if value is not a string, is blank or is 'empty' (in any case)
+    """
+    if not isinstance(value, basestring) or value in _EMPTY_VALUES:
+        return True
+    return value.lower() == 'empty'
+
+
+def _get_freqstep(target_bandwidth_mhz, chan_width_hz, divisors):
+    """
+    Returns the frequency step nearest to the target bandwidth
+
+    The step is limited to the divisors of the number of channels (the last
+    entry of the sorted divisors)
+    """
+    step = max(1, min(int(round(target_bandwidth_mhz * 1e6 / chan_width_hz)), divisors[-1]))
+    return get_nearest_divisor(divisors, step)
+
+
+def _get_low_freqstep(nchan, low_freqstep):
+    """
+    Returns the largest divisor of nchan at or below low_freqstep
+
+    If there are no channels, low_freqstep is returned unchanged
+    """
+    if nchan == 0:
+        return low_freqstep
+    divisors = get_divisors(nchan)
+    return int(divisors[np.searchsorted(divisors, low_freqstep, side='right') - 1])
+
+
+# Optimum image sizes (see Direction.get_optimum_size()), precomputed once as
+# there are only a few thousand of them below the cap
+_OPTIMUM_SIZES = _make_optimum_sizes(2**24)
 
 
 class Direction(object):
@@ -59,16 +176,21 @@ class Direction(object):
         Size in degrees of calibrator source(s)
 
     """
+    # Attributes that are not pickled: the log and sky model objects cannot be
+    # pickled, and the cleanup mapfiles are only needed until the operation
+    # that set them has been cleaned up
+    _NO_PICKLE = ('log', 'skymodel', 'cleanup_mapfiles')
+
     def __init__(self, name, ra, dec, mscale_selfcal_do=False, mscale_facet_do=False,
     	cal_imsize=512, solint_p=1, solint_a=30, dynamic_range='LD',
     	region_selfcal='empty', region_field='empty', peel_skymodel='empty',
     	outlier_do=False, factor_working_dir='', cal_size_deg=None):
         self.name = name
         self.log = logging.getLogger('factor:{0}'.format(self.name))
-        if type(ra) is str:
-            ra = Angle(ra).to('deg').value
-        if type(dec) is str:
-            dec = Angle(dec).to('deg').value
+        if isinstance(ra, basestring):
+            ra = angle_to_deg(ra, is_ra=True)
+        if isinstance(dec, basestring):
+            dec = angle_to_deg(dec)
         self.ra = ra
         self.dec = dec
         self.mscale_selfcal_do = mscale_selfcal_do
@@ -80,7 +202,7 @@ class Direction(object):
         if self.dynamic_range.lower() not in ['ld', 'hd']:
             self.log.error('Dynamic range is "{}" but must be either "LD" or "HD".'.format(self.dynamic_range))
             sys.exit(1)
-        if region_selfcal.lower() == 'empty':
+        if _is_empty(region_selfcal):
             # Set to empty list (casa format)
             self.region_selfcal = '[]'
         else:
@@ -90,7 +212,7 @@ class Direction(object):
             self.region_selfcal = '["{0}"]'.format(region_selfcal)
             self.log.info('Using calibrator clean-mask region file {}'.format(self.region_selfcal))
         self.region_field = region_field
-        if self.region_field.lower() == 'empty':
+        if _is_empty(self.region_field):
             self.region_field = '[]'
         elif not os.path.exists(self.region_field):
             self.log.error('Facet region file {} not found.'.format(self.region_field))
@@ -98,7 +220,7 @@ class Direction(object):
         else:
             self.log.info('Using facet clean-mask region file {}'.format(self.region_field))
         self.peel_skymodel = peel_skymodel
-        if self.peel_skymodel.lower() == 'empty':
+        if _is_empty(self.peel_skymodel):
             self.peel_skymodel = None
         elif not os.path.exists(self.peel_skymodel):
             self.log.error('Peel sky model file {} not found.'.format(self.peel_skymodel))
@@ -327,10 +449,12 @@ class Direction(object):
         fb = self.frac_bandwidth_selfcal_facet_image
         self.startchan_selfcal_facet_image = int((1.0 - fb) * nchan / 2.0)
         self.nchan_selfcal_facet_image = int(fb * nchan)
-        while self.nchan_selfcal_facet_image % self.facetimage_freqstep:
-            self.nchan_selfcal_facet_image += 1
-        while self.nchan_selfcal_facet_image/self.facetimage_freqstep % self.facetimage_low_freqstep:
-            self.facetimage_low_freqstep -= 1
+        # Round the number of channels up to a multiple of the frequency step
+        # and reduce the low-res step to the nearest divisor at or below it
+        self.nchan_selfcal_facet_image = (-(-self.nchan_selfcal_facet_image //
+            self.facetimage_freqstep) * self.facetimage_freqstep)
+        self.facetimage_low_freqstep = _get_low_freqstep(self.nchan_selfcal_facet_image /
+            self.facetimage_freqstep, self.facetimage_low_freqstep)
         if self.nbands_selfcal_facet_image > 1:
             self.wsclean_selfcal_facet_image_suffix = '-MFS-image.fits'
         else:
@@ -424,8 +548,8 @@ class Direction(object):
         # the number of bands. We use 6 times more iterations for the full2
         # image to ensure the imager has a reasonable chance to reach the
         # threshold first (which is set by the masking step)
-        scaling_factor = np.sqrt(np.float(nbands))
-        scaling_factor_selfcal = np.sqrt(np.float(nbands_selfcal)*frac_bandwidth_selfcal)
+        scaling_factor = math.sqrt(nbands)
+        scaling_factor_selfcal = math.sqrt(float(nbands_selfcal)*frac_bandwidth_selfcal)
         self.wsclean_selfcal_full_image_niter = int(4000 * scaling_factor_selfcal)
         self.wsclean_selfcal_full_image_threshold_jy =  1.5e-3 * 0.7 / scaling_factor_selfcal
         self.wsclean_full1_image_niter = int(4000 * scaling_factor)
@@ -473,7 +597,9 @@ class Direction(object):
         """
         Gets the nearest optimum image size
 
-        Taken from the casa source code (cleanhelper.py)
+        The optimum size is the smallest even number greater than or equal to
+        the target size that has no prime factors larger than 7 (as in the casa
+        source code, cleanhelper.py)
 
         Parameters
         ----------
@@ -486,49 +612,16 @@ class Direction(object):
             Optimum image size nearest to target size
 
         """
-        import numpy
-
-        def prime_factors(n, douniq=True):
-            """ Return the prime factors of the given number. """
-            factors = []
-            lastresult = n
-            sqlast=int(numpy.sqrt(n))+1
-            if n == 1:
-                return [1]
-            c=2
-            while 1:
-                 if (lastresult == 1) or (c > sqlast):
-                     break
-                 sqlast=int(numpy.sqrt(lastresult))+1
-                 while 1:
-                     if(c > sqlast):
-                         c=lastresult
-                         break
-                     if lastresult % c == 0:
-                         break
-                     c += 1
-
-                 factors.append(c)
-                 lastresult /= c
-
-            if (factors==[]): factors=[n]
-            return  numpy.unique(factors).tolist() if douniq else factors
-
         n = int(size)
         if (n%2 != 0):
             n+=1
-        fac=prime_factors(n, False)
-        for k in range(len(fac)):
-            if (fac[k] > 7):
-                val=fac[k]
-                while (numpy.max(prime_factors(val)) > 7):
-                    val +=1
-                fac[k]=val
-        newlarge=numpy.product(fac)
-        for k in range(n, newlarge, 2):
-            if ((numpy.max(prime_factors(k)) < 8)):
-                return k
-        return newlarge
+        if n <= _OPTIMUM_SIZES[-1]:
+            return int(_OPTIMUM_SIZES[np.searchsorted(_OPTIMUM_SIZES, n)])
+
+        # Target is beyond the precomputed sizes, so search for the size directly
+        while not _is_7_smooth(n):
+            n += 2
+        return n
 
 
     def set_skymodel(self, skymodel):
@@ -662,12 +755,8 @@ class Direction(object):
             If True, set only imaging-related parameters
 
         """
-        # generate a (numpy-)array with the divisors of nchan
-        tmp_divisors = []
-        for step in range(nchan, 0, -1):
-            if (nchan % step) == 0:
-                tmp_divisors.append(step)
-        freq_divisors = np.array(tmp_divisors)
+        # Get the divisors of nchan
+        freq_divisors = get_divisors(nchan)
 
         # For selfcal, use the size of the calibrator to set the averaging
         # steps
@@ -675,7 +764,7 @@ class Direction(object):
             # Set min allowable smearing reduction factor for bandwidth and time
             # smearing so that they are equal and their product is 0.85
             min_peak_smearing_factor_selfcal = 0.85
-            peak_smearing_factor = np.sqrt(min_peak_smearing_factor_selfcal)
+            peak_smearing_factor = math.sqrt(min_peak_smearing_factor_selfcal)
 
             # Get target time and frequency averaging steps
             delta_theta_deg = self.cal_size_deg / 2.0
@@ -693,8 +782,7 @@ class Direction(object):
             self.log.debug('Target bandwidth for selfcal is {} MHz'.format(target_bandwidth_mhz))
 
             # Find averaging steps for given target values
-            self.facetselfcal_freqstep = max(1, min(int(round(target_bandwidth_mhz * 1e6 / chan_width_hz)), nchan))
-            self.facetselfcal_freqstep = freq_divisors[np.argmin(np.abs(freq_divisors - self.facetselfcal_freqstep))]
+            self.facetselfcal_freqstep = _get_freqstep(target_bandwidth_mhz, chan_width_hz, freq_divisors)
             self.facetselfcal_timestep = max(1, int(round(target_timewidth_s / timestep_sec)))
             self.facetselfcal_timestep_sec = self.facetselfcal_timestep * timestep_sec
             self.log.debug('Using averaging steps of {0} channels and {1} time slots '
@@ -702,8 +790,7 @@ class Direction(object):
 
             # For selfcal verify, average to 2 MHz per channel and 120 sec per time
             # slot
-            self.verify_freqstep = max(1, min(int(round(2.0 * 1e6 / chan_width_hz)), nchan))
-            self.verify_freqstep = freq_divisors[np.argmin(np.abs(freq_divisors - self.verify_freqstep))]
+            self.verify_freqstep = _get_freqstep(2.0, chan_width_hz, freq_divisors)
             self.verify_timestep = max(1, int(round(120.0 / timestep_sec)))
 
         # For facet imaging, use the facet image size (before padding) to set the averaging steps
@@ -711,7 +798,7 @@ class Direction(object):
             # Set min allowable smearing reduction factor for bandwidth and time
             # smearing so that they are equal and their product is
             # min_peak_smearing_factor
-            peak_smearing_factor = np.sqrt(min_peak_smearing_factor)
+            peak_smearing_factor = math.sqrt(min_peak_smearing_factor)
 
             # Get target time and frequency averaging steps
             delta_theta_deg = self.facet_imsize_nopadding * self.cellsize_facet_deg / 2.0
@@ -726,8 +813,7 @@ class Direction(object):
             self.log.debug('Target bandwidth for facet imaging is {} MHz'.format(target_bandwidth_mhz))
 
             # Find averaging steps for given target values
-            self.facetimage_freqstep = max(1, min(int(round(target_bandwidth_mhz * 1e6 / chan_width_hz)), nchan))
-            self.facetimage_freqstep = freq_divisors[np.argmin(np.abs(freq_divisors - self.facetimage_freqstep))]
+            self.facetimage_freqstep = _get_freqstep(target_bandwidth_mhz, chan_width_hz, freq_divisors)
             self.facetimage_timestep = max(1, int(round(target_timewidth_s / timestep_sec)))
             self.facetimage_timestep_sec = self.facetimage_timestep * timestep_sec
             self.log.debug('Using averaging steps of {0} channels and {1} time slots '
@@ -735,24 +821,18 @@ class Direction(object):
 
             # Do the same for the low-resolution facet image. Note that these steps
             # are in addition to the full-res steps
-            # generate another (numpy-)array with the divisors of nchan after averaging
+            # get the divisors of nchan after averaging
             nchan_after_facetimage = nchan / self.facetimage_freqstep
             chan_width_hz_after_facetimage = chan_width_hz * self.facetimage_freqstep
-            tmp_divisors = []
-            for step in range(nchan_after_facetimage, 0, -1):
-                if (nchan_after_facetimage % step) == 0:
-                    tmp_divisors.append(step)
-            freq_divisors_low = np.array(tmp_divisors)
+            freq_divisors_low = get_divisors(nchan_after_facetimage)
             low_res_factor = 4.0 # how much lower resolution is than high-res image
             resolution_low_deg = 3.0 * low_res_factor * self.cellsize_facet_deg # assume normal sampling of restoring beam
             target_timewidth_s = min(120.0, self.get_target_timewidth(delta_theta_deg,
                 resolution_low_deg, peak_smearing_factor))
             target_bandwidth_mhz = min(2.0, self.get_target_bandwidth(mean_freq_mhz,
                 delta_theta_deg, resolution_low_deg, peak_smearing_factor))
-            self.facetimage_low_freqstep = max(1, min(int(round(target_bandwidth_mhz * 1e6 /
-                chan_width_hz_after_facetimage)), nchan_after_facetimage))
-            self.facetimage_low_freqstep = freq_divisors_low[np.argmin(np.abs(
-                freq_divisors_low - self.facetimage_low_freqstep))]
+            self.facetimage_low_freqstep = _get_freqstep(target_bandwidth_mhz,
+                chan_width_hz_after_facetimage, freq_divisors_low)
             self.facetimage_low_timestep = max(1, int(round(target_timewidth_s /
                 self.facetimage_timestep_sec)))
             self.facetimage_low_timestep_sec = (self.facetimage_low_timestep *
@@ -1042,19 +1122,36 @@ class Direction(object):
         return (nbands, max_gap)
 
 
+    def __getstate__(self):
+        """
+        Returns the direction attributes to pickle
+        """
+        return dict((k, v) for k, v in self.__dict__.iteritems()
+            if k not in self._NO_PICKLE)
+
+
+    def __setstate__(self, state):
+        """
+        Restores the pickled attributes and resets the unpickled ones
+        """
+        self.__dict__.update(state)
+        self.log = logging.getLogger('factor:{0}'.format(self.name))
+        self.skymodel = None
+        self.cleanup_mapfiles = []
+
+
     def save_state(self):
         """
         Saves the direction state to a file
 
         """
-        import pickle
 
-        with open(self.save_file, 'wb') as f:
-            # Remove log and skymodel objects, as they cannot be pickled
-            save_dict = self.__dict__.copy()
-            save_dict.pop('log')
-            save_dict.pop('skymodel')
-            pickle.dump(save_dict, f)
+        # Write to a temporary file first and then rename it, so that an
+        # interrupted save cannot leave a truncated state file behind
+        temp_file = self.save_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            pickle.dump(self.__getstate__(), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_file, self.save_file)
 
 
     def load_state(self):
@@ -1069,10 +1166,13 @@ class Direction(object):
         success : bool
             True if state was successfully loaded, False if not
         """
-        import pickle
+        # Most directions have no state file on the first run, so check for
+        # it directly instead of relying on the exception from open()
+        if not os.path.isfile(self.save_file):
+            return False
 
         try:
-            with open(self.save_file, 'r') as f:
+            with open(self.save_file, 'rb') as f:
                 d = pickle.load(f)
 
                 # Load list of started operations
@@ -1094,7 +1194,8 @@ class Direction(object):
                     self.image_data_mapfile = d['image_data_mapfile']
 
             return True
-        except:
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
             return False
 
 
@@ -1130,17 +1231,17 @@ class Direction(object):
             self.selfcal_ok = False
 
         # Remove operation name from lists of started and completed operations
-        # and delete the results directories
         for op_name in op_names_reset:
             while op_name.lower() in self.completed_operations:
                 self.completed_operations.remove(op_name.lower())
             while op_name.lower() in self.started_operations:
                 self.started_operations.remove(op_name.lower())
 
-            # Delete results directory for this operation
-            op_dir = os.path.join(self.working_dir, 'results', op_name.lower(), self.name)
-            if os.path.exists(op_dir):
-                os.system('rm -rf {0}'.format(op_dir))
+        # Delete results directories for these operations. The operation names
+        # may differ only in case, so duplicate directories are removed
+        op_dirs = set(os.path.join(self.working_dir, 'results', op_name.lower(), self.name)
+                      for op_name in op_names_reset)
+        _remove_paths(list(op_dirs))
 
         self.save_state()
 
@@ -1149,43 +1250,73 @@ class Direction(object):
         """
         Cleans up unneeded data
         """
-        from lofarpipe.support.data_map import DataMap
-        import glob
 
+        # Collect all the paths first, so that they can be deleted together.
+        # Paths that do not exist are skipped by _remove_paths(), so they are
+        # not checked here
+        files = []
         for mapfile in self.cleanup_mapfiles:
             try:
-                datamap = DataMap.load(mapfile)
-                for item in datamap:
-                    # Handle case in which item.file is a Python list
-                    if item.file[0] == '[' and item.file[-1] == ']':
-                        files = item.file.strip('[]').split(',')
-                    else:
-                        files = [item.file]
-                    for f in files:
-                        if os.path.exists(f):
-                            os.system('rm -rf {0} &'.format(f))
-
-                            # Also delete associated "_CONCAT" files that result
-                            # from virtual concatenation
-                            extra_files = glob.glob(f+'_CONCAT')
-                            for e in extra_files:
-                                if os.path.exists(e):
-                                    os.system('rm -rf {0} &'.format(e))
-
-                        # Deal with special case of f being a WSClean image
-                        if f.endswith('MFS-image.fits'):
-                            # Search for related images and delete if found
-                            image_root = f.split('MFS-image.fits')[0]
-                            extra_files = glob.glob(image_root+'*.fits')
-                            for e in extra_files:
-                                if os.path.exists(e):
-                                    os.system('rm -rf {0} &'.format(e))
-                        elif f.endswith('-image.fits'):
-                            # Search for related images and delete if found
-                            image_root = f.split('-image.fits')[0]
-                            extra_files = glob.glob(image_root+'*.fits')
-                            for e in extra_files:
-                                if os.path.exists(e):
-                                    os.system('rm -rf {0} &'.format(e))
+                datamap = load_datamap(mapfile)
             except IOError:
-                pass
+                continue
+            # Handle case in which item.file is a Python list
+            files.extend(f for item in datamap for f in (item.file.strip('[]').split(',')
+                if item.file.startswith('[') and item.file.endswith(']') else [item.file]))
+
+        # Find the associated "_CONCAT" files that result from virtual
+        # concatenation and, for WSClean images, the related images. Each glob
+        # pattern is searched only once
+        patterns = set(f+'_CONCAT' for f in files)
+        for f in files:
+            # Deal with special case of f being a WSClean image
+            if f.endswith('MFS-image.fits'):
+                patterns.add(f.split('MFS-image.fits')[0]+'*.fits')
+            elif f.endswith('-image.fits'):
+                patterns.add(f.split('-image.fits')[0]+'*.fits')
+        files_to_remove = set(files)
+        for pattern in patterns:
+            files_to_remove.update(glob.glob(pattern))
+        _remove_paths(list(files_to_remove))
+
+
+def _remove_path(path):
+    """
+    Deletes a file or directory (if it exists)
+
+    Parameters
+    ----------
+    path : str
+        Path to delete
+
+    """
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_paths(paths, max_threads=8):
+    """
+    Deletes files and directories in parallel
+
+    The deletion is done in Python with a pool of threads, avoiding a shell
+    for each path
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to delete
+    max_threads : int, optional
+        Maximum number of threads to use
+
+    """
+    if len(paths) == 0:
+        return
+    pool = multiprocessing.pool.ThreadPool(processes=min(max_threads, len(paths)))
+    pool.map(_remove_path, paths)
+    pool.close()
+    pool.join()
@@ -0,0 +1,62 @@
+"""
+Functions for finding the divisors of the number of channels, used to set the
+frequency steps of the bands and directions
+"""
+import math
+import numpy as np
+
+# Cache of divisors (see get_divisors())
+_divisors_cache = {}
+
+
+def get_divisors(n):
+    """
+    Returns the divisors of n
+
+    Divisors come in pairs (i, n/i), so only i <= sqrt(n) need be tested. The
+    arrays are cached, as the same few channel numbers are used by all bands
+    and directions. Note that the returned array is shared between callers and
+    should not be modified
+
+    Parameters
+    ----------
+    n : int
+        Number to find the divisors of
+
+    Returns
+    -------
+    divisors : array
+        Sorted array of the divisors of n
+
+    """
+    n = int(n)
+    if n not in _divisors_cache:
+        small = [d for d in range(1, int(math.sqrt(n)) + 1) if n % d == 0]
+        large = [n // d for d in reversed(small) if d * d != n]
+        _divisors_cache[n] = np.array(small + large)
+        _divisors_cache[n].setflags(write=False)
+    return _divisors_cache[n]
+
+
+def get_nearest_divisor(divisors, step):
+    """
+    Returns the divisor nearest to step
+
+    Parameters
+    ----------
+    divisors : array
+        Sorted array of divisors (see get_divisors())
+    step : int
+        Target step
+
+    Returns
+    -------
+    divisor : int
+        Divisor nearest to step. In case of a tie, the larger one is used
+
+    """
+    # The nearest divisor is one of the two that bracket the target step
+    ind = min(np.searchsorted(divisors, step), len(divisors) - 1)
+    if ind > 0 and step - divisors[ind-1] < divisors[ind] - step:
+        ind -= 1
+    return int(divisors[ind])
@@ -19,6 +19,9 @@ env_parset = Environment(loader=FileSystemLoader(os.path.join(DIR, '..', 'pipeli
     'parsets')))
 env_config = Environment(loader=FileSystemLoader(os.path.join(DIR, '..', 'pipeline')))
 
+# Cache of loaded datamaps (see load_datamap())
+_datamap_cache = {}
+
 
 class Operation(object):
     """
@@ -228,6 +231,25 @@ class Operation(object):
         pass
 
 
+    def get_mapfiles(self, basenames):
+        """
+        Returns the full paths of mapfiles in the pipeline mapfile directory
+
+        Parameters
+        ----------
+        basenames : list of str
+            Basenames of the mapfiles
+
+        Returns
+        -------
+        mapfiles : list of str
+            Full paths of the mapfiles
+
+        """
+        mapfile_dir = os.path.join(self.pipeline_mapfile_dir, '')
+        return [mapfile_dir + basename for basename in basenames]
+
+
     def check_started(self):
         """
         Checks whether operation has been started (but not necessarily
@@ -303,12 +325,10 @@ class Operation(object):
             True if all files in mapfile exist, False if not
 
         """
-        from lofarpipe.support.data_map import DataMap
-
         all_exist = True
         self.log.debug('Checking for existing files...')
         try:
-            datamap = DataMap.load(mapfile)
+            datamap = load_datamap(mapfile)
             for item in datamap:
                 # Handle case in which item.file is a Python list
                 if item.file[0] == '[' and item.file[-1] == ']':
@@ -412,23 +432,62 @@ class Operation(object):
     def cleanup(self):
         """
         Cleans up temp files in the scratch directories of each node
+
+        The scratch directories are removed with a single command per node, and
+        the nodes are cleaned up in parallel
         """
-        if self.local_scratch_dir is not None:
-            for node in self.node_list:
-                if node == 'localhost':
-                    cmd = ['rm', '-rf', self.local_scratch_dir]
-                else:
-                    cmd = ['ssh', node, 'rm', '-rf', self.local_scratch_dir]
-                tmp = subprocess.call(cmd)
-        if self.local_selfcal_scratch_dir is not None:
+        scratch_dirs = [d for d in [self.local_scratch_dir, self.local_selfcal_scratch_dir]
+            if d is not None]
+        if len(scratch_dirs) > 0:
+            procs = []
             for node in self.node_list:
                 if node == 'localhost':
-                    cmd = ['rm', '-rf', self.local_selfcal_scratch_dir]
+                    cmd = ['rm', '-rf'] + scratch_dirs
                 else:
-                    cmd = ['ssh', node, 'rm', '-rf', self.local_selfcal_scratch_dir]
-                tmp = subprocess.call(cmd)
+                    cmd = ['ssh', node, 'rm', '-rf'] + scratch_dirs
+                procs.append(subprocess.Popen(cmd))
+            for proc in procs:
+                proc.wait()
 
+        if self.local_selfcal_scratch_dir is not None:
             # Check whether we need to reset the pipeline state to before the sync step
             steptypes = self.get_steptypes()
             if 'sync_files' in steptypes and 'remove_synced_data' not in steptypes:
                 self.reset_state_to_steptype('sync_files')
+
+
+def load_datamap(mapfile):
+    """
+    Loads a datamap, reusing the result of an earlier load of the same file
+
+    The cache is keyed by the file's modification time and size, so a mapfile
+    that is rewritten (e.g., by a rerun of a pipeline) is reloaded. Note that the
+    returned DataMap object is shared between callers and should not be
+    modified
+
+    Parameters
+    ----------
+    mapfile : str
+        Filename of mapfile to load
+
+    Returns
+    -------
+    datamap : DataMap
+        Loaded datamap
+
+    """
+    from lofarpipe.support.data_map import DataMap
+
+    try:
+        st = os.stat(mapfile)
+    except OSError:
+        # Let DataMap raise its usual error for missing files
+        return DataMap.load(mapfile)
+
+    key = (mapfile, st.st_mtime, st.st_size)
+    if key not in _datamap_cache:
+        if len(_datamap_cache) >= 256:
+            _datamap_cache.clear()
+        _datamap_cache[key] = DataMap.load(mapfile)
+    return _datamap_cache[key]
+
@@ -24,9 +24,8 @@ FacetPeelImage:  Operation
 """
 import os
 import ast
-from factor.lib.operation import Operation
+from factor.lib.operation import Operation, load_datamap
 from factor.operations.outlier_ops import OutlierPeel
-from lofarpipe.support.data_map import DataMap
 
 
 class FacetSelfcal(Operation):
@@ -164,7 +163,7 @@ class FacetSelfcal(Operation):
         # was done using multiple bands although we use only one at the moment
         if (os.path.exists(self.direction.verify_subtract_mapfile) and not
             self.parset['calibration_specific']['skip_selfcal_check']):
-            ok_mapfile = DataMap.load(self.direction.verify_subtract_mapfile)
+            ok_mapfile = load_datamap(self.direction.verify_subtract_mapfile)
             ok_flags = [ast.literal_eval(item.file) for item in ok_mapfile]
             if all(ok_flags):
                 self.direction.selfcal_ok = True
@@ -178,39 +177,39 @@ class FacetSelfcal(Operation):
         # Delete all data used only for selfcal as they're no longer needed.
         # Note: we keep the data if selfcal failed verification, so that the user
         # can check them for problems
-        self.direction.cleanup_mapfiles = [
-            os.path.join(self.pipeline_mapfile_dir, 'make_sourcedb_all_facet_sources.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'make_sourcedb_cal_facet_sources.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat_averaged_input.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'average_pre_compressed.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'average_post_compressed.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'corrupt_final_model.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'shift_cal.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'shift_cal_dir_indep.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'make_concat_corr.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'make_blavg_data.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'sorted_groups.mapfile_groups'),
-            os.path.join(self.pipeline_mapfile_dir, 'sorted_average0_groups.mapfile_groups'),
-            os.path.join(self.pipeline_mapfile_dir, 'average0.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'average2.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat0_input.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat1_input.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat2_input.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat3_input.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat4_input.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'wsclean_image01_imagename.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'wsclean_image11_imagename.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'wsclean_image21_imagename.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'wsclean_image31_imagename.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'wsclean_image41_imagename.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'apply_amp1.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'apply_amp2.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'apply_output.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'apply_phaseonly1.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'apply_phaseonly2.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'subtract_high.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'prepare_imaging_data.mapfile')
-            ]
+        self.direction.cleanup_mapfiles = self.get_mapfiles([
+            'make_sourcedb_all_facet_sources.mapfile',
+            'make_sourcedb_cal_facet_sources.mapfile',
+            'concat_averaged_input.mapfile',
+            'average_pre_compressed.mapfile',
+            'average_post_compressed.mapfile',
+            'corrupt_final_model.mapfile',
+            'shift_cal.mapfile',
+            'shift_cal_dir_indep.mapfile',
+            'make_concat_corr.mapfile',
+            'make_blavg_data.mapfile',
+            'sorted_groups.mapfile_groups',
+            'sorted_average0_groups.mapfile_groups',
+            'average0.mapfile',
+            'average2.mapfile',
+            'concat0_input.mapfile',
+            'concat1_input.mapfile',
+            'concat2_input.mapfile',
+            'concat3_input.mapfile',
+            'concat4_input.mapfile',
+            'wsclean_image01_imagename.mapfile',
+            'wsclean_image11_imagename.mapfile',
+            'wsclean_image21_imagename.mapfile',
+            'wsclean_image31_imagename.mapfile',
+            'wsclean_image41_imagename.mapfile',
+            'apply_amp1.mapfile',
+            'apply_amp2.mapfile',
+            'apply_output.mapfile',
+            'apply_phaseonly1.mapfile',
+            'apply_phaseonly2.mapfile',
+            'subtract_high.mapfile',
+            'prepare_imaging_data.mapfile'
+            ])
         if self.direction.selfcal_ok or not self.parset['calibration_specific']['exit_on_selfcal_failure']:
             self.log.debug('Cleaning up files (direction: {})'.format(self.direction.name))
             self.direction.cleanup()
@@ -388,25 +387,25 @@ class FacetImage(Operation):
             self.direction.full_res_facetimage_timestep = self.direction.facetimage_timestep
 
         # Delete temp data
-        self.direction.cleanup_mapfiles = [
-            os.path.join(self.pipeline_mapfile_dir, 'image1.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'add_all_facet_sources.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'corrupt_final_model.mapfile')]
+        self.direction.cleanup_mapfiles = self.get_mapfiles([
+            'image1.mapfile',
+            'add_all_facet_sources.mapfile',
+            'corrupt_final_model.mapfile'])
         if ((not self.parset['keep_avg_facet_data'] and not self.direction.contains_target) or
            self.direction.use_existing_data):
             # Add averaged calibrated data for the facet to files to be deleted.
             # These are only needed if the user wants to reimage by hand (e.g.,
             # with a different weighting) or for subsequent imaging runs. They
             # are always kept for the target direction
-            self.direction.cleanup_mapfiles.extend([
-                os.path.join(self.pipeline_mapfile_dir, 'concat_averaged_input.mapfile'),
-                os.path.join(self.pipeline_mapfile_dir, 'sorted_groups.mapfile_groups')])
+            self.direction.cleanup_mapfiles.extend(self.get_mapfiles([
+                'concat_averaged_input.mapfile',
+                'sorted_groups.mapfile_groups']))
         if not self.parset['keep_unavg_facet_data']:
             # Add unaveraged calibrated data for the facet to files to be deleted
-            self.direction.cleanup_mapfiles.extend([
-                os.path.join(self.pipeline_mapfile_dir, 'shift_empty.mapfile'),
-                os.path.join(self.pipeline_mapfile_dir, 'sorted_groups_shift_empty.mapfile'),
-                os.path.join(self.pipeline_mapfile_dir, 'sorted_groups_shift_empty.mapfile_groups')])
+            self.direction.cleanup_mapfiles.extend(self.get_mapfiles([
+                'shift_empty.mapfile',
+                'sorted_groups_shift_empty.mapfile',
+                'sorted_groups_shift_empty.mapfile_groups']))
         self.log.debug('Cleaning up files (direction: {})'.format(self.direction.name))
         self.direction.cleanup()
         self.cleanup()
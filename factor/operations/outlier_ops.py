@@ -12,8 +12,7 @@ import os
 import ast
 import sys
 import logging
-from factor.lib.operation import Operation
-from lofarpipe.support.data_map import DataMap
+from factor.lib.operation import Operation, load_datamap
 
 log = logging.getLogger('factor:outlier_ops')
 
@@ -91,7 +90,7 @@ class OutlierPeel(Operation):
         # was done using multiple bands although we use only one at the moment
         if (os.path.exists(self.direction.verify_subtract_mapfile) and not
             self.parset['calibration_specific']['skip_selfcal_check']):
-            ok_mapfile = DataMap.load(self.direction.verify_subtract_mapfile)
+            ok_mapfile = load_datamap(self.direction.verify_subtract_mapfile)
             ok_flags = [ast.literal_eval(item.file) for item in ok_mapfile]
             if all(ok_flags):
                 self.direction.selfcal_ok = True
@@ -103,13 +102,13 @@ class OutlierPeel(Operation):
             self.direction.selfcal_ok = False
 
         # Delete temp data
-        self.direction.cleanup_mapfiles = [
-            os.path.join(self.pipeline_mapfile_dir, 'shift_cal.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'concat_data.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'apply_dir_dep.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'average_pre.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'average_post.mapfile'),
-            os.path.join(self.pipeline_mapfile_dir, 'sorted_groups.mapfile_groups')]
+        self.direction.cleanup_mapfiles = self.get_mapfiles([
+            'shift_cal.mapfile',
+            'concat_data.mapfile',
+            'apply_dir_dep.mapfile',
+            'average_pre.mapfile',
+            'average_post.mapfile',
+            'sorted_groups.mapfile_groups'])
         self.log.debug('Cleaning up files (direction: {})'.format(self.direction.name))
         self.direction.cleanup()
         self.cleanup()
@@ -1,29 +1,29 @@
 """
 Module that preforms the processing
 """
-from lofar.parameterset import _pyparameterset
 import sys
 import os
-import shutil
 import numpy as np
 import logging
-import pickle
-import collections
+import operator
 import casacore.tables as pt
-from lofarpipe.support.data_map import DataMap
 import factor
 import factor.directions
 import factor.parset
 import factor.cluster
-from factor.operations.outlier_ops import *
-from factor.operations.field_ops import *
-from factor.operations.facet_ops import *
+from factor.operations.outlier_ops import OutlierPeel
+from factor.operations.field_ops import FieldMosaic
+from factor.operations.facet_ops import (FacetSelfcal, FacetPeel, FacetSub,
+    FacetSubReset, FacetImage)
 from factor.lib.scheduler import Scheduler
 from factor.lib.direction import Direction
 from factor.lib.band import Band
+from factor.lib.operation import load_datamap
 
 
 log = logging.getLogger('factor')
+_YES_ANSWERS = frozenset(['y', 'yes'])
+_NO_ANSWERS = frozenset(['n', 'no'])
 
 
 def run(parset_file, logging_level='info', dry_run=False, test_run=False,
@@ -193,6 +193,7 @@ def run(parset_file, logging_level='info', dry_run=False, test_run=False,
             for d in direction_group:
                 d.selfcal_ok = True
         direction_group_ok = [d for d in direction_group if d.selfcal_ok]
+        direction_group_failed = [d for d in direction_group if not d.selfcal_ok]
         if set_sub_data_colname:
             # Set the name of the subtracted data column for remaining
             # directions (if needed)
@@ -217,17 +218,16 @@ def run(parset_file, logging_level='info', dry_run=False, test_run=False,
             scheduler.run(op)
 
         # Handle directions in this group for which selfcal failed
-        selfcal_ok = [d.selfcal_ok for d in direction_group]
-        for d in direction_group:
-            if not d.selfcal_ok:
-                log.warn('Self calibration failed for direction {0}.'.format(d.name))
-        if not all(selfcal_ok) and parset['calibration_specific']['exit_on_selfcal_failure']:
+        for d in direction_group_failed:
+            log.warn('Self calibration failed for direction {0}.'.format(d.name))
+        if len(direction_group_failed) > 0 and parset['calibration_specific']['exit_on_selfcal_failure']:
             log.info('Exiting...')
             sys.exit(1)
 
     # Check that at least one direction went through selfcal successfully. If
     # not, exit
-    if len([d for d in directions if d.selfcal_ok]) == 0:
+    dirs_with_selfcal = [d for d in directions if d.selfcal_ok]
+    if len(dirs_with_selfcal) == 0:
         log.warn('Self calibration failed for all directions. Exiting...')
         sys.exit(1)
 
@@ -238,7 +238,6 @@ def run(parset_file, logging_level='info', dry_run=False, test_run=False,
     min_uvs = parset['imaging_specific']['facet_min_uv_lambda']
     selfcal_robust = parset['imaging_specific']['selfcal_robust']
     nimages = len(cellsizes)
-    dirs_with_selfcal = [d for d in directions if d.selfcal_ok]
     if parset['imaging_specific']['image_target_only']:
         dirs_with_selfcal_to_image = [d for d in dirs_with_selfcal if not d.is_patch
             and not d.is_outlier and d.contains_target]
@@ -252,9 +251,10 @@ def run(parset_file, logging_level='info', dry_run=False, test_run=False,
     if len(dirs_without_selfcal_to_image) > 0:
         log.info('Imaging the following direction(s) with nearest self calibration solutions:')
         log.info('{0}'.format([d.name for d in dirs_without_selfcal_to_image]))
-    for d in dirs_without_selfcal_to_image:
-        # Search for nearest direction with successful selfcal
-        nearest, sep = factor.directions.find_nearest(d, dirs_with_selfcal)
+    # Search for nearest direction with successful selfcal
+    nearest_with_selfcal = factor.directions.find_nearest_all(dirs_without_selfcal_to_image,
+        dirs_with_selfcal)
+    for d, (nearest, sep) in zip(dirs_without_selfcal_to_image, nearest_with_selfcal):
         log.debug('Using solutions from direction {0} for direction {1} '
             '(separation = {2} deg).'.format(nearest.name, d.name, sep))
         d.dir_dep_h5parm_mapfile = nearest.dir_dep_h5parm_mapfile
@@ -327,7 +327,7 @@ def run(parset_file, logging_level='info', dry_run=False, test_run=False,
                     robust, selfcal_robust, min_uv_lambda, parset)
                 for d in dirs_to_image:
                     if not d.is_patch:
-                        facet_image = DataMap.load(d.facet_image_mapfile[opname])[0].file
+                        facet_image = load_datamap(d.facet_image_mapfile[opname])[0].file
                         field.facet_image_filenames.append(facet_image)
                         field.facet_vertices_filenames.append(d.save_file)
 
@@ -492,8 +492,7 @@ def _set_up_bands(parset, test_run=False):
             bands.append(band)
 
     # Sort bands by frequency
-    band_freqs = [band.freq for band in bands]
-    bands = np.array(bands)[np.argsort(band_freqs)].tolist()
+    bands.sort(key=operator.attrgetter('freq'))
 
     # Check bands for problems
     nchan_list = []
@@ -607,11 +606,7 @@ def _set_up_directions(parset, bands, dry_run=False, test_run=False,
             "internally, you must delete the FACTOR-made directions file\n"
             "(dir_working/factor_directions.txt) before restarting if you want\n"
             "FACTOR to regenerate it\n")
-        prompt = "Continue processing (y/n)? "
-        answ = raw_input(prompt)
-        while answ.lower() not in  ['y', 'n', 'yes', 'no']:
-            answ = raw_input(prompt)
-        if answ.lower() in ['n', 'no']:
+        if not _ask_yes_no("Continue processing (y/n)? "):
             log.info('Exiting...')
             sys.exit(0)
         else:
@@ -621,7 +616,7 @@ def _set_up_directions(parset, bands, dry_run=False, test_run=False,
                 ref_band, max_radius_deg=max_radius_deg, dry_run=dry_run)
 
     # Warn user if they've specified a direction to reset that does not exist
-    direction_names = [d.name for d in directions]
+    direction_names = set(d.name for d in directions)
     for name in reset_directions:
         if name not in direction_names and name != 'field':
             log.warn('Direction {} was specified for resetting but does not '
@@ -643,7 +638,7 @@ def _set_up_directions(parset, bands, dry_run=False, test_run=False,
             directions = directions[:dir_parset['ndir_process']]
 
             # Make sure target is still included
-            direction_names = [d.name for d in directions]
+            direction_names = set(d.name for d in directions)
             if target_has_own_facet and 'target' not in direction_names:
                 directions.append(target)
 
@@ -762,16 +757,19 @@ def _initialize_directions(parset, initial_skymodel, ref_band, max_radius_deg=No
 
     """
     dir_parset = parset['direction_specific']
+    working_dir = parset['dir_working']
+    factor_directions_file = os.path.join(working_dir, 'factor_directions.txt')
+    regions_dir = os.path.join(working_dir, 'regions')
     s = initial_skymodel.copy()
 
     # First check for user-supplied directions file, then for Factor-generated
     # file from a previous run, then for parameters needed to generate it internally
     if 'directions_file' in dir_parset:
         directions = factor.directions.directions_read(dir_parset['directions_file'],
-            parset['dir_working'])
-    elif os.path.exists(os.path.join(parset['dir_working'], 'factor_directions.txt')):
-        directions = factor.directions.directions_read(os.path.join(parset['dir_working'],
-            'factor_directions.txt'), parset['dir_working'])
+            working_dir)
+    elif os.path.exists(factor_directions_file):
+        directions = factor.directions.directions_read(factor_directions_file,
+            working_dir)
     else:
         if dir_parset['flux_min_jy'] is None or \
             dir_parset['size_max_arcmin'] is None or \
@@ -811,7 +809,7 @@ def _initialize_directions(parset, initial_skymodel, ref_band, max_radius_deg=No
                     interactive=parset['interactive'],
                     flux_min_for_merging_Jy=dir_parset['flux_min_for_merging_jy'])
             directions = factor.directions.directions_read(dir_parset['directions_file'],
-                parset['dir_working'])
+                working_dir)
 
     # Add the target to the directions list if desired
     target_ra = dir_parset['target_ra']
@@ -821,7 +819,7 @@ def _initialize_directions(parset, initial_skymodel, ref_band, max_radius_deg=No
     if target_ra is not None and target_dec is not None and target_radius_arcmin is not None:
         # Make target object
         target = Direction('target', target_ra, target_dec,
-            factor_working_dir=parset['dir_working'])
+            factor_working_dir=working_dir)
         if target_has_own_facet:
             target.contains_target = True
 
@@ -857,9 +855,9 @@ def _initialize_directions(parset, initial_skymodel, ref_band, max_radius_deg=No
         target_radius_arcmin=target_radius_arcmin, beam_ratio=beam_ratio)
 
     # Make DS9 region files so user can check the facets, etc.
-    ds9_facet_reg_file = os.path.join(parset['dir_working'], 'regions', 'facets_ds9.reg')
+    ds9_facet_reg_file = os.path.join(regions_dir, 'facets_ds9.reg')
     factor.directions.make_ds9_region_file(directions, ds9_facet_reg_file)
-    ds9_calimage_reg_file = os.path.join(parset['dir_working'], 'regions', 'calimages_ds9.reg')
+    ds9_calimage_reg_file = os.path.join(regions_dir, 'calimages_ds9.reg')
     factor.directions.make_ds9_calimage_file(directions, ds9_calimage_reg_file)
 
     return directions
@@ -902,3 +900,30 @@ def _get_image_type_and_name(cellsize_arcsec, taper_arcsec, robust, selfcal_robu
         full_res_im = True
 
     return full_res_im, opname
+
+
+def _ask_yes_no(prompt):
+    """
+    Asks the user a yes/no question until a valid answer is given
+
+    Parameters
+    ----------
+    prompt : str
+        Prompt to print
+
+    Returns
+    -------
+    answer : bool
+        True for yes and False for no. End of input (e.g., when stdin is not
+        a terminal) is taken as no
+
+    """
+    while True:
+        try:
+            answ = raw_input(prompt).strip().lower()
+        except EOFError:
+            return False
+        if answ in _YES_ANSWERS:
+            return True
+        if answ in _NO_ANSWERS:
+            return False
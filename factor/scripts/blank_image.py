@@ -18,7 +18,7 @@ def read_vertices(filename):
     """
     Returns facet vertices stored in input file
     """
-    with open(filename, 'r') as f:
+    with open(filename, 'rb') as f:
         direction_dict = pickle.load(f)
     return direction_dict['vertices']
 
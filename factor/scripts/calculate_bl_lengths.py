@@ -31,7 +31,7 @@ def main(ms_input, output_file):
     baseline_dict = get_baseline_lengths(ms_list[0])
 
     with open(output_file, 'wb') as f:
-        pickle.dump(baseline_dict, f)
+        pickle.dump(baseline_dict, f, pickle.HIGHEST_PROTOCOL)
 
 
 def input2strlist(invar):
@@ -5,10 +5,10 @@ Script to split a dataset into chunks of equal time
 import argparse
 from argparse import RawTextHelpFormatter
 import casacore.tables as pt
-import numpy as np
 import sys
 import os
 import shutil
+from factor.lib.band import read_ms_metadata
 
 
 def main(dataset, blockl, local_dir=None, clobber=True):
@@ -39,35 +39,34 @@ def main(dataset, blockl, local_dir=None, clobber=True):
         blockl = 1
 
     # Get time per sample and number of samples
-    t = pt.table(dataset, readonly=True, ack=False)
-    for t2 in t.iter(["ANTENNA1","ANTENNA2"]):
-        if (t2.getcell('ANTENNA1',0)) < (t2.getcell('ANTENNA2',0)):
-            timepersample = t2[1]['TIME']-t2[0]['TIME'] # sec
-            nsamples = t2.nrows()
-            break
-    t.close()
+    meta = read_ms_metadata(dataset)
+    timepersample = meta['timepersample'] # sec
+    nsamples = meta['ntimes']
 
-    nchunks = int(np.ceil((np.float(nsamples) / np.float(blockl))))
+    nchunks = -(-nsamples // blockl) # ceiling division
 
     # Don't allow more than 15 chunks for performance reasons
     while nchunks > 15:
         blockl *= 2
-        nchunks = int(np.ceil((np.float(nsamples) / np.float(blockl))))
+        nchunks = -(-nsamples // blockl)
 
-    tlen = timepersample * np.float(blockl) / 3600.0 # length of block in hours
+    tlen = timepersample * float(blockl) / 3600.0 # length of block in hours
     tobs = timepersample * nsamples / 3600.0 # length of obs in hours
 
     # Copy to local directory if needed
     dataset_original = dataset
     if local_dir is not None:
         dataset = os.path.join(local_dir, os.path.basename(dataset_original))
-        os.system('/usr/bin/rsync -a {0} {1}'.format(dataset_original, local_dir))
+        if not (os.path.exists(dataset) and os.path.samefile(dataset, dataset_original)):
+            if os.path.exists(dataset):
+                shutil.rmtree(dataset)
+            shutil.copytree(dataset_original, dataset, symlinks=True)
 
     files = []
     for c in range(nchunks):
         chunk_file = '{0}_chunk{1}.ms'.format(os.path.splitext(dataset_original)[0], c)
         files.append(chunk_file)
-        t0 = tlen * np.float(c) # hours
+        t0 = tlen * float(c) # hours
         t1 = t0 + tlen # hours
         if c == 0:
             t0 = -0.1 # make sure first chunk gets first slot
@@ -104,7 +103,7 @@ def split_ms(msin, msout, start_out, end_out, local_dir, clobber=True):
     """
     if os.path.exists(msout):
         if clobber:
-            os.system('rm -rf {0}'.format(msout))
+            shutil.rmtree(msout, ignore_errors=True)
         else:
             return
 
@@ -112,7 +111,7 @@ def split_ms(msin, msout, start_out, end_out, local_dir, clobber=True):
     if local_dir is not None:
         msout = os.path.join(local_dir, os.path.basename(msout_original))
         if os.path.exists(msout):
-            os.system('rm -rf {0}'.format(msout))
+            shutil.rmtree(msout, ignore_errors=True)
 
     t = pt.table(msin, ack=False)
     starttime = t[0]['TIME']
@@ -125,10 +124,10 @@ def split_ms(msin, msout, start_out, end_out, local_dir, clobber=True):
     t.close()
 
     if local_dir is not None:
-        msout_destination_dir = os.path.dirname(msout_original)
-        os.system('/usr/bin/rsync -a {0} {1}'.format(msout, msout_destination_dir))
-        if not os.path.samefile(msout, msout_original):
-            shutil.rmtree(msout)
+        # Move the file to the original output location (a rename if both are
+        # on the same filesystem)
+        if not (os.path.exists(msout_original) and os.path.samefile(msout, msout_original)):
+            shutil.move(msout, msout_original)
 
 
 if __name__ == '__main__':
@@ -136,31 +136,33 @@ def main(fast_parmdb, slow_parmdb, output_file, freqstep=1, preapply_parmdb=None
                 slow_soldict = slow_pdb.getValues('*{}*'.format(station), final_freqs, final_freqwidths,
                     fast_times[g_start:g], fast_timewidths[g_start:g], asStartEnd=False)
             try:
-                fast_phase = np.copy(fast_soldict['CommonScalarPhase:{s}'.format(s=station)]['values'])
-                tec = np.copy(fast_soldict['TEC:{s}'.format(s=station)]['values'])
+                # The values are only read below, so no copies are needed
+                fast_phase = fast_soldict['CommonScalarPhase:{s}'.format(s=station)]['values']
+                tec = fast_soldict['TEC:{s}'.format(s=station)]['values']
                 tec_phase =  -8.44797245e9 * tec / final_freqs
 
+                # Zero phase solutions are the same for all polarizations
+                zero_fast = np.logical_or(fast_phase == 0.0, tec_phase == 0.0)
+
                 for pol in pol_list:
-                    slow_real = np.copy(slow_soldict['Gain:'+pol+':Real:{s}'.format(s=station)]['values'])
-                    slow_imag = np.copy(slow_soldict['Gain:'+pol+':Imag:{s}'.format(s=station)]['values'])
-                    slow_amp = np.sqrt((slow_real**2) + (slow_imag**2))
+                    slow_real = slow_soldict['Gain:'+pol+':Real:{s}'.format(s=station)]['values']
+                    slow_imag = slow_soldict['Gain:'+pol+':Imag:{s}'.format(s=station)]['values']
+                    slow_amp = np.hypot(slow_real, slow_imag)
                     slow_phase = np.arctan2(slow_imag, slow_real)
 
                     total_amp = slow_amp
                     if preapply_parmdb is not None:
-                        fast_phase_preapply = np.copy(preapply_soldict['Gain:'+pol+':Phase:{s}'.format(s=station)]['values'])
+                        fast_phase_preapply = preapply_soldict['Gain:'+pol+':Phase:{s}'.format(s=station)]['values']
                         total_phase = np.mod(fast_phase + tec_phase + slow_phase +
                             fast_phase_preapply + np.pi, 2*np.pi) - np.pi
-
-                        # Identify zero phase solutions and set the corresponding entries in total_phase and total_amp to NaN
-                        total_phase = np.where(fast_phase_preapply == 0.0, np.nan, total_phase)
-                        total_amp = np.where(fast_phase_preapply == 0.0, np.nan, total_amp)
+                        zero_phase = np.logical_or(zero_fast, fast_phase_preapply == 0.0)
                     else:
                         total_phase = np.mod(fast_phase + tec_phase + slow_phase + np.pi, 2*np.pi) - np.pi
+                        zero_phase = zero_fast
 
                     # Identify zero phase solutions and set the corresponding entries in total_phase and total_amp to NaN
-                    total_phase = np.where(np.logical_or(fast_phase == 0.0, tec_phase == 0.0), np.nan, total_phase)
-                    total_amp = np.where(np.logical_or(fast_phase == 0.0, tec_phase == 0.0), np.nan, total_amp)
+                    total_phase = np.where(zero_phase, np.nan, total_phase)
+                    total_amp = np.where(zero_phase, np.nan, total_amp)
 
                     output_pdb.addValues('Gain:'+pol+':Phase:{}'.format(station),
                         total_phase, final_freqs, final_freqwidths,
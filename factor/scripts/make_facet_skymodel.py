@@ -23,7 +23,7 @@ def read_vertices(filename, cal_only=False):
         Filename of pickled file with direction vertices
 
     """
-    with open(filename, 'r') as f:
+    with open(filename, 'rb') as f:
         direction_dict = pickle.load(f)
     if cal_only:
         return direction_dict['vertices_cal']
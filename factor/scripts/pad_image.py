@@ -15,7 +15,9 @@ def get_optimum_size(size):
     """
     Gets the nearest optimum image size
 
-    Taken from the casa source code (cleanhelper.py)
+    The optimum size is the smallest even number greater than or equal to the
+    target size that has no prime factors larger than 7 (as in the casa source
+    code, cleanhelper.py)
 
     Parameters
     ----------
@@ -28,47 +30,21 @@ def get_optimum_size(size):
         Optimum image size nearest to target size
 
     """
-    def prime_factors(n, douniq=True):
-        """ Return the prime factors of the given number. """
-        factors = []
-        lastresult = n
-        sqlast=int(np.sqrt(n))+1
-        if n == 1:
-            return [1]
-        c=2
-        while 1:
-             if (lastresult == 1) or (c > sqlast):
-                 break
-             sqlast=int(np.sqrt(lastresult))+1
-             while 1:
-                 if(c > sqlast):
-                     c=lastresult
-                     break
-                 if lastresult % c == 0:
-                     break
-                 c += 1
-
-             factors.append(c)
-             lastresult /= c
-
-        if (factors==[]): factors=[n]
-        return np.unique(factors).tolist() if douniq else factors
+    def is_7_smooth(n):
+        """ Return True if n has no prime factors larger than 7. """
+        for p in (2, 3, 5, 7):
+            while n % p == 0:
+                n //= p
+        return n == 1
 
     n = int(size)
+    if n <= 0:
+        return 0
     if (n%2 != 0):
         n+=1
-    fac=prime_factors(n, False)
-    for k in range(len(fac)):
-        if (fac[k] > 7):
-            val=fac[k]
-            while (np.max(prime_factors(val)) > 7):
-                val +=1
-            fac[k]=val
-    newlarge=np.product(fac)
-    for k in range(n, newlarge, 2):
-        if ((np.max(prime_factors(k)) < 8)):
-            return k
-    return newlarge
+    while not is_7_smooth(n):
+        n += 2
+    return n
 
 
 def main(root, scalefactor=1.5):
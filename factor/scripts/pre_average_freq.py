@@ -40,7 +40,7 @@ def main(ms_input, input_colname, output_data_colname, output_weights_colname,
 
     """
     if os.path.exists(baseline_file):
-        f = open(baseline_file, 'r')
+        f = open(baseline_file, 'rb')
         baseline_dict = pickle.load(f)
         f.close()
     else:
@@ -66,8 +66,8 @@ def update_state(dir_input):
                                         if len(parts) > 1:
                                             v[i] = os.path.join(working_dir, infix, parts[-1])
                             d[k] = v
-                with open(f, "w") as fp:
-                    pickle.dump(d, fp)
+                with open(f, "wb") as fp:
+                    pickle.dump(d, fp, pickle.HIGHEST_PROTOCOL)
             except:
                 pass
 
@@ -0,0 +1,16 @@
+"""
+Tests for the frequency-step helpers of the direction class
+"""
+from factor.lib.direction import _get_low_freqstep
+
+
+def test_get_low_freqstep():
+    assert _get_low_freqstep(12, 5) == 4
+    assert _get_low_freqstep(12, 6) == 6
+    assert _get_low_freqstep(7, 6) == 1
+
+
+def test_get_low_freqstep_no_channels():
+    # A facet-imaging bandwidth fraction of 0 gives no channels, in which case
+    # the step is left unchanged
+    assert _get_low_freqstep(0, 3) == 3
@@ -0,0 +1,14 @@
+"""
+Tests for the image padding script
+"""
+from factor.scripts.pad_image import get_optimum_size
+
+
+def test_get_optimum_size():
+    assert get_optimum_size(1000) == 1000
+    assert get_optimum_size(1001) == 1008
+    assert get_optimum_size(1025) == 1050
+
+
+def test_get_optimum_size_zero():
+    assert get_optimum_size(0) == 0